@@ -47,7 +47,9 @@ setup(
         "numpy>=1.20.0",
         "scipy>=1.5.0",
         "cython",
+        "matplotlib>=3.3",
         "mdtraj>=1.9.5",
+        "natsort>=7.0.0",
         "pandas>=0.23.0",
         "threadpoolctl>=2.2.0",
     ],
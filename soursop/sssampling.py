@@ -0,0 +1,1016 @@
+##     _____  ____  _    _ _____   _____  ____  _____
+##   / ____|/ __ \| |  | |  __ \ / ____|/ __ \|  __ \
+##  | (___ | |  | | |  | | |__) | (___ | |  | | |__) |
+##   \___ \| |  | | |  | |  _  / \___ \| |  | |  ___/
+##   ____) | |__| | |__| | | \ \ ____) | |__| | |
+##  |_____/ \____/ \____/|_|  \_\_____/ \____/|_|
+
+## Alex Holehouse (Pappu Lab and Holehouse Lab) and Jared Lalmansing (Pappu lab)
+## Simulation analysis package
+## Copyright 2014 - 2022
+##
+
+"""
+sssampling contains the SamplingQuality class and a small set of stand-alone
+helper functions used to assess how well a set of all-atom simulations has
+sampled conformational space relative to a reference (typically an excluded
+volume or other polymer-model) ensemble. Comparisons are performed on a
+per-residue basis using distance metrics computed between backbone dihedral
+distributions.
+
+"""
+
+import pathlib
+from concurrent import futures
+
+import numpy as np
+import mdtraj as md
+from natsort import natsorted
+
+from .configs import MAXCORES
+from .sstrajectory import SSTrajectory
+from .ssexceptions import SSException, notYetImplementedException
+from . import ssutils
+
+# numba is an optional dependency - when present, a fused parallel kernel
+# is used for the histogram+Hellinger hot path (see below). When absent
+# everything falls back to the pure numpy implementation.
+try:
+    import numba
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# default bin width for dihedral histograms (radians) - 15 degrees
+BWIDTH_DEFAULT = np.deg2rad(15)
+
+
+# ........................................................................
+#
+def glob_traj_paths(root_dir, num_reps=None, exclude_dirs=None, traj_name='__traj.xtc', top_name='__START.pdb'):
+    """
+    Function that recursively collects trajectory and topology paths beneath
+    a root directory. This is convenient when simulations are organized as
+    one directory per replicate (e.g. ``<root>/<run>/1/__traj.xtc``).
+
+    Parameters
+    ----------
+    root_dir : str
+        Root directory from which the recursive search is started.
+
+    num_reps : int
+        If provided, limits the number of replicate trajectories collected
+        per directory tree. Default = None (i.e. collect everything found).
+
+    exclude_dirs : list of str
+        List of directory names that should be skipped during the search.
+        Default = None, which maps to ['eq', 'FULL'] (equilibration and
+        full-length directories commonly found in CAMPARI projects).
+
+    traj_name : str
+        Filename pattern which trajectory files must match.
+        Default = '__traj.xtc'.
+
+    top_name : str
+        Filename pattern which topology files must match.
+        Default = '__START.pdb'.
+
+    Returns
+    -------
+    tuple of lists
+        Returns a 2-tuple of (topology paths, trajectory paths), each in
+        natural sort order (i.e. replicate 2 before replicate 10).
+
+    """
+
+    if exclude_dirs is None:
+        exclude_dirs = ['eq', 'FULL']
+
+    # a single rglob pass per pattern keeps the tree walk at the C level,
+    # and the set-based isdisjoint check excludes any hit that sits below
+    # an excluded directory at any depth
+    root = pathlib.Path(root_dir)
+    exclude = set(exclude_dirs)
+
+    # natural sort so numbered replicate directories order 1, 2, ..., 10
+    # rather than lexicographically - with num_reps a plain sort would
+    # slice out the wrong replicate subset
+    top_paths = natsorted(str(p) for p in root.rglob(top_name) if exclude.isdisjoint(p.parts))
+    traj_paths = natsorted(str(p) for p in root.rglob(traj_name) if exclude.isdisjoint(p.parts))
+
+    if num_reps is not None:
+        top_paths = top_paths[:num_reps]
+        traj_paths = traj_paths[:num_reps]
+
+    return (top_paths, traj_paths)
+
+
+# ........................................................................
+#
+def _same_distribution(p, q):
+    """
+    Internal helper that detects when p and q are literally the same data -
+    either the same array object, or views with identical shape, strides
+    and starting address. Baseline workflows often compare an ensemble
+    against itself, and in that case every distance metric is exactly zero
+    so the sqrt/log passes can be skipped. Views that merely overlap are
+    not treated as identical.
+
+    """
+
+    if p is q:
+        return True
+
+    try:
+        return (p.shape == q.shape and
+                p.strides == q.strides and
+                p.__array_interface__['data'] == q.__array_interface__['data'])
+    except AttributeError:
+        return False
+
+
+# ........................................................................
+#
+def _get_reduction_axis(p, q):
+    """
+    Internal helper that maps the dimensionality of a pair of distributions
+    onto the axis over which the histogram bins run. Distributions are always
+    binned along the final axis, so for a single histogram (1D), a set of
+    per-residue histograms (2D), a set of per-trajectory, per-residue
+    histograms (3D) or a stacked per-dihedral set of those (4D) the bin
+    axis is simply the last one.
+
+    """
+
+    if p.shape != q.shape:
+        raise SSException('Distributions p and q must have matching shapes. Passed shapes: p=%s, q=%s' % (str(p.shape), str(q.shape)))
+
+    if p.ndim not in (1, 2, 3, 4):
+        raise SSException('Distributions must be 1- to 4-dimensional arrays of histograms. Passed arrays with ndim=%i' % (p.ndim))
+
+    return p.ndim - 1
+
+
+if NUMBA_AVAILABLE:
+
+    # ........................................................................
+    #
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _hellinger_dihedral_kernel(angles_p, angles_q, lo, bwidth, nbins):
+        """
+        Fused numba kernel that computes the Hellinger distance between the
+        dihedral distributions of two ensembles directly from the raw angle
+        arrays (radians), without materializing intermediate PDF arrays.
+
+        Each row of ``angles_p``/``angles_q`` is one independent
+        (dihedral, trajectory, residue) series of frames, so the rows are
+        processed in parallel with prange. The two ensembles may carry
+        different frame counts - each histogram is normalized by its own.
+        Per row, both histograms are accumulated into small local count
+        buffers and the Bhattacharyya coefficient is then reduced over the
+        bins, so the angle data is read exactly once and nothing larger
+        than the bin count is allocated per thread.
+
+        """
+
+        n_rows = angles_p.shape[0]
+        n_frames_p = angles_p.shape[1]
+        n_frames_q = angles_q.shape[1]
+        inv_bwidth = 1.0 / bwidth
+
+        out = np.empty(n_rows)
+
+        for row in prange(n_rows):
+            counts_p = np.zeros(nbins)
+            counts_q = np.zeros(nbins)
+
+            for frame in range(n_frames_p):
+                i = int((angles_p[row, frame] - lo) * inv_bwidth)
+                if i < 0:
+                    i = 0
+                elif i > nbins - 1:
+                    i = nbins - 1
+                counts_p[i] += 1.0
+
+            for frame in range(n_frames_q):
+                j = int((angles_q[row, frame] - lo) * inv_bwidth)
+                if j < 0:
+                    j = 0
+                elif j > nbins - 1:
+                    j = nbins - 1
+                counts_q[j] += 1.0
+
+            # each histogram is normalized by its own frame count -
+            # sum(sqrt((cp/np)*(cq/nq))) == sum(sqrt(cp*cq))/sqrt(np*nq)
+            bc = 0.0
+            for b in range(nbins):
+                bc += np.sqrt(counts_p[b] * counts_q[b])
+            bc = bc / np.sqrt(n_frames_p * n_frames_q)
+
+            diff = 1.0 - bc
+            if diff < 0.0:
+                diff = 0.0
+            out[row] = np.sqrt(diff)
+
+        return out
+
+
+# ........................................................................
+#
+def _hellinger_from_sqrt(sp, sq):
+    """
+    Internal helper that computes Hellinger distances from the square roots
+    of two distributions. With sqrt(p) and sqrt(q) in hand the distance is
+    just the Euclidean norm of their difference along the bin axis scaled
+    by 1/sqrt(2), so callers that can cache distributions in sqrt form (see
+    SamplingQuality) avoid the two sqrt passes that hellinger_distance
+    performs on every call.
+
+    The difference form is used here (rather than the Bhattacharyya inner
+    product) because it is exactly zero for bitwise-equal inputs - the
+    inner product loses ~n*eps of probability mass to roundoff, which
+    sqrt(1 - bc) then amplifies into a spurious ~1e-4 distance when an
+    ensemble is compared against itself.
+
+    """
+
+    return np.linalg.norm(sp - sq, axis=-1) / np.sqrt(2)
+
+
+# ........................................................................
+#
+def hellinger_distance(p, q):
+    """
+    Compute the Hellinger distance between two discrete probability
+    distributions. The distance is evaluated via the Bhattacharyya
+    coefficient BC = sum( sqrt(p*q) ), using the identity:
+
+        H(p,q) = sqrt( 1 - BC(p,q) )
+
+    which is algebraically equivalent to the textbook form
+    sqrt( sum( (sqrt(p) - sqrt(q))^2 ) ) / sqrt(2) but needs a single
+    elementwise multiply, sqrt and reduction rather than two sqrt passes
+    plus a difference and a square. The distance is bounded between 0 (identical distributions) and 1
+    (non-overlapping distributions). Distributions are binned along the
+    final axis, so arrays of histograms can be passed and the distance is
+    computed independently for each leading index.
+
+    Parameters
+    ----------
+    p : np.ndarray
+        Probability distribution(s) with bins along the final axis. Can be
+        1D (single histogram), 2D (per-residue), 3D (per-trajectory,
+        per-residue) or 4D (per-dihedral stacks of the 3D layout).
+
+    q : np.ndarray
+        Probability distribution(s) with the same shape as ``p``.
+
+    Returns
+    -------
+    np.ndarray or float
+        The Hellinger distance(s) between p and q, with the bin axis
+        reduced away.
+
+    """
+
+    axis = _get_reduction_axis(p, q)
+
+    if _same_distribution(p, q):
+        return np.zeros(p.shape[:-1])
+
+    bc = np.sum(np.sqrt(p*q), axis=axis)
+
+    # clamp at zero to guard against floating-point roundoff pushing the
+    # coefficient marginally above 1 for near-identical distributions
+    hellingers = np.sqrt(np.maximum(0.0, 1.0 - bc))
+
+    return hellingers
+
+
+# ........................................................................
+#
+def rel_entropy(p, q):
+    """
+    Compute the relative entropy (Kullback-Leibler divergence) between two
+    discrete probability distributions:
+
+        D_KL(p||q) = sum( p * log(p/q) )
+
+    Note that the relative entropy is not symmetric and is unbounded - in
+    particular, if q is zero anywhere that p is non-zero the divergence is
+    infinite. Distributions are binned along the final axis, so arrays of
+    histograms can be passed and the divergence is computed independently
+    for each leading index.
+
+    Parameters
+    ----------
+    p : np.ndarray
+        Probability distribution(s) with bins along the final axis. Can be
+        1D (single histogram), 2D (per-residue), 3D (per-trajectory,
+        per-residue) or 4D (per-dihedral stacks of the 3D layout).
+
+    q : np.ndarray
+        Probability distribution(s) with the same shape as ``p``.
+
+    Returns
+    -------
+    np.ndarray or float
+        The relative entropy of p with respect to q, with the bin axis
+        reduced away.
+
+    """
+
+    axis = _get_reduction_axis(p, q)
+
+    if _same_distribution(p, q):
+        return np.zeros(p.shape[:-1])
+
+    # compute p * (log(p) - log(q)) with every operation writing into a
+    # preallocated buffer rather than allocating fresh temporaries. Bins
+    # where p == 0 contribute nothing (the 0*log(0) limit) and are excluded
+    # from the logs via the where= mask; bins where p > 0 but q == 0
+    # correctly diverge to inf.
+    mask = p > 0
+
+    out = np.zeros_like(p, dtype=np.float64)
+    tmp = np.zeros_like(out)
+
+    np.log(p, where=mask, out=out)
+    with np.errstate(divide='ignore'):
+        np.log(q, where=mask, out=tmp)
+
+    out -= tmp
+    out *= p
+
+    return np.sum(out, axis=axis)
+
+
+# ........................................................................
+#
+#
+class SamplingQuality:
+    """
+    SamplingQuality compares a set of simulation trajectories against a set
+    of reference (polymer-model) trajectories of the same protein, and
+    reports per-residue distance metrics between the backbone dihedral
+    distributions of the two ensembles.
+
+    **Class Variables**
+
+    .trajs : list
+        List of SSTrajectory objects for the simulation ensemble.
+
+    .polymer_trajs : list
+        List of SSTrajectory objects for the polymer-model reference ensemble.
+
+    .dihedral_angles : np.ndarray
+        Backbone dihedral angles (radians) for the simulation ensemble with
+        shape (2, n_trajectories, n_residues, n_frames), where index 0 along
+        the first axis is phi and index 1 is psi. Stacking both dihedrals
+        into one array means histogramming, sqrt and the metric reductions
+        each run as a single larger numpy operation instead of two.
+
+    .polymer_dihedral_angles : np.ndarray
+        As above, for the polymer-model reference ensemble.
+
+    """
+
+    # ........................................................................
+    #
+    #
+    def __init__(self,
+                 traj_list,
+                 polymer_model_traj_list,
+                 top_file,
+                 polymer_top,
+                 method,
+                 bwidth=BWIDTH_DEFAULT,
+                 proteinID=0,
+                 n_cpus=None,
+                 truncate=False,
+                 **kwargs):
+        """
+        Parameters
+        ----------
+        traj_list : list
+            List of paths to simulation trajectories, or a list of
+            pre-loaded SSTrajectory objects.
+
+        polymer_model_traj_list : list
+            List of paths to the polymer-model reference trajectories, or a
+            list of pre-loaded SSTrajectory objects.
+
+        top_file : str
+            Path to the topology file associated with the simulation
+            trajectories. Ignored if SSTrajectory objects are passed.
+
+        polymer_top : str
+            Path to the topology file associated with the polymer-model
+            trajectories. Ignored if SSTrajectory objects are passed.
+
+        method : str
+            The method used to compare the two ensembles. Currently only
+            'dihedral' is implemented; 'rmsd' and 'p_vects' are reserved
+            for future use.
+
+        bwidth : float
+            Bin width (in radians) used when constructing the dihedral
+            histograms. Default = 15 degrees (np.deg2rad(15)).
+
+        proteinID : int
+            Index of the protein within each trajectory to be assessed
+            (i.e. the index into ``proteinTrajectoryList``). Default = 0.
+
+        n_cpus : int
+            Number of CPUs used for parallel work (e.g. trajectory loading).
+            Default = None, which maps to all available cores.
+
+        truncate : bool
+            If True, the dihedral angle arrays are truncated to the number
+            of frames in the shortest trajectory of either ensemble.
+            Per-residue histogramming requires all trajectories to share a
+            common frame count, so this should be set if trajectory lengths
+            differ. Note the underlying trajectories are left untouched -
+            only the extracted angle arrays are windowed, which avoids
+            copying coordinate data that is never read again. Default = False.
+
+        """
+
+        ssutils.validate_keyword_option(method, ['dihedral', 'rmsd', 'p_vects'], 'method')
+
+        if method in ['rmsd', 'p_vects']:
+            raise notYetImplementedException('The %s method is not yet implemented. Please use the dihedral method.' % (method))
+
+        if not 0 < bwidth <= 2*np.pi:
+            raise SSException('The bwidth parameter must be a radian value between 0 and 2*pi. Passed value: %s' % (str(bwidth)))
+
+        if n_cpus is None:
+            n_cpus = MAXCORES
+
+        self.method = method
+        self.bwidth = bwidth
+        self.proteinID = proteinID
+        self.n_cpus = n_cpus
+
+        # the bin edges depend only on bwidth, so build them once here
+        # rather than re-deriving them in every metric/property consumer.
+        # Edges are built directly in radians - rounding to whole degrees
+        # would silently substitute a different width than the one requested
+        # and collapses to a zero step for widths below half a degree
+        self._rad_bins = np.arange(-np.pi, np.pi + bwidth, bwidth)
+        self._deg_bins = np.rad2deg(self._rad_bins)
+
+        self._metric_cache = {}
+
+        self.trajs = self.__load_trajectories(traj_list, top_file, **kwargs)
+        self.polymer_trajs = self.__load_trajectories(polymer_model_traj_list, polymer_top, **kwargs)
+
+        # when truncating, only the extracted dihedral arrays are windowed to
+        # the shortest trajectory - slicing the trajectories themselves would
+        # copy every xyz array just to throw the coordinates away again
+        self.min_length = None
+        if truncate:
+            lengths = np.fromiter((t.n_frames for t in self.trajs + self.polymer_trajs), dtype=np.int64)
+            self.min_length = int(lengths.min())
+
+        if self.method == 'dihedral':
+            self.dihedral_angles = self.__compute_dihedrals(self.trajs, proteinID, self.min_length)
+            self.polymer_dihedral_angles = self.__compute_dihedrals(self.polymer_trajs, proteinID, self.min_length)
+
+            # the input trajectories are immutable, so the dihedral PDFs (and
+            # their square roots, which the Hellinger distance consumes) are
+            # computed exactly once here and reused by every metric and
+            # property access
+            self._pdf = self.__compute_pdfs(self.dihedral_angles, self._rad_bins)
+            self._polymer_pdf = self.__compute_pdfs(self.polymer_dihedral_angles, self._rad_bins)
+
+            self._sqrt_pdf = np.sqrt(self._pdf)
+            self._sqrt_polymer_pdf = np.sqrt(self._polymer_pdf)
+
+    # ........................................................................
+    #
+    #
+    def __load_trajectories(self, traj_list, top_file, **kwargs):
+        """
+        Internal function that maps a list of trajectory paths (or
+        pre-loaded SSTrajectory objects) to a list of SSTrajectory objects.
+        Reading from disk is farmed out over a thread pool because mdtraj
+        releases the GIL during file I/O, so loading many replicas in
+        parallel is substantially faster than a serial loop.
+
+        """
+
+        if len(traj_list) == 0:
+            raise SSException('An empty trajectory list was passed to SamplingQuality.')
+
+        # if the caller already did the work, just take the objects as-is
+        if all(isinstance(t, SSTrajectory) for t in traj_list):
+            return list(traj_list)
+
+        with futures.ThreadPoolExecutor(max_workers=self.n_cpus) as executor:
+            trajs = list(executor.map(lambda path: SSTrajectory(path, top_file, **kwargs), traj_list))
+
+        return trajs
+
+    # ........................................................................
+    #
+    #
+    def __compute_dihedrals(self, trajs, proteinID, n_frames=None):
+        """
+        Internal function that computes the backbone phi and psi angles for
+        every trajectory in an ensemble. Angles are kept in radians and
+        stacked into a single array of shape
+        (2, n_trajectories, n_residues, n_frames), where index 0 along the
+        first axis is phi and index 1 is psi. If ``n_frames`` is provided,
+        each per-trajectory angle array is truncated to its first
+        ``n_frames`` frames.
+
+        """
+
+        # the topology is shared across every replicate in an ensemble, so
+        # the phi/psi atom quadruplets are resolved once against a single
+        # frame of the first trajectory rather than re-walking the topology
+        # for every replicate. A single compute_dihedrals call per
+        # trajectory then evaluates both dihedral sets in one pass.
+        first = trajs[0].proteinTrajectoryList[proteinID].traj
+        phi_indices = md.compute_phi(first[:1])[0]
+        psi_indices = md.compute_psi(first[:1])[0]
+
+        indices = np.vstack([phi_indices, psi_indices])
+        n_phi = len(phi_indices)
+
+        phi = []
+        psi = []
+
+        for trj in trajs:
+            protein_traj = trj.proteinTrajectoryList[proteinID].traj
+            angles = md.compute_dihedrals(protein_traj, indices).T
+
+            if n_frames is not None:
+                angles = angles[:, :n_frames]
+
+            phi.append(angles[:n_phi])
+            psi.append(angles[n_phi:])
+
+        # all per-trajectory arrays must share a frame count before they can
+        # be stacked into one contiguous tensor - a ragged input would make
+        # numpy fall back to a dtype=object array, which silently defeats
+        # every vectorized operation downstream. Fail loudly with the fix in
+        # hand instead.
+        frame_counts = set(a.shape[-1] for a in phi)
+        if len(frame_counts) > 1:
+            raise SSException('Trajectories have different numbers of frames (%s). Pass truncate=True to window every trajectory to the shortest one.' % (sorted(frame_counts)))
+
+        # mdtraj emits float32 angles - keep that dtype end-to-end, since
+        # 24-bin histograms gain nothing from double precision and the
+        # halved memory traffic matters on the digitize/histogram path
+        return np.stack((np.stack(phi), np.stack(psi))).astype(np.float32, copy=False)
+
+    # ........................................................................
+    #
+    #
+    def __compute_pdfs(self, arr, bins):
+        """
+        Internal function that computes the stacked PDFs for one ensemble.
+        Trajectories are histogrammed independently, so when several are
+        present the work is farmed out over a thread pool sized by the
+        n_cpus requested at construction - numpy releases the GIL inside
+        the bincount accumulation, so the per-trajectory tasks genuinely
+        run concurrently. With a single trajectory (or a single CPU) the
+        fully-vectorized single-call path is used instead.
+
+        """
+
+        n_trj = arr.shape[1]
+
+        if self.n_cpus <= 1 or n_trj < 2:
+            return self.compute_pdf(arr, bins)
+
+        with futures.ThreadPoolExecutor(max_workers=min(self.n_cpus, n_trj)) as executor:
+            pdfs = list(executor.map(lambda i: self.compute_pdf(arr[:, i], bins), range(n_trj)))
+
+        return np.stack(pdfs, axis=1)
+
+    # ........................................................................
+    #
+    #
+    def get_degree_bins(self):
+        """
+        Returns the histogram bin edges (in degrees) implied by the bin
+        width the object was constructed with. Bins span the full circle
+        from -180 to +180 degrees and are computed once at construction.
+
+        Returns
+        -------
+        np.ndarray
+            Array of bin edges in degrees.
+
+        """
+
+        return self._deg_bins
+
+    # ........................................................................
+    #
+    #
+    def get_radian_bins(self):
+        """
+        Returns the histogram bin edges (in radians) implied by the bin
+        width the object was constructed with. Bins span the full circle
+        from -pi to +pi and are computed once at construction.
+
+        Returns
+        -------
+        np.ndarray
+            Array of bin edges in radians.
+
+        """
+
+        return self._rad_bins
+
+    # ........................................................................
+    #
+    #
+    def compute_pdf(self, arr, bins):
+        """
+        Compute a probability density function along the final axis of an
+        array of dihedral angles. Any number of leading axes is supported,
+        so per-residue and per-trajectory histograms are computed in a
+        single pass.
+
+        Because the bins are uniform, the bin index of every angle can be
+        computed in closed form rather than per-row calls to np.histogram:
+        the angles are mapped onto integer bin indices with one affine
+        transform, each row of indices is offset into its own private range,
+        and a single np.bincount call then accumulates every histogram at
+        once. This avoids a Python-level loop over residues/trajectories.
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Array of dihedral angles in radians, where the final axis runs
+            over frames (e.g. shape (n_trajectories, n_residues, n_frames)).
+
+        bins : np.ndarray
+            Monotonically increasing bin edges in radians spanning the full
+            -pi to pi range. Uniform edges (as returned by
+            ``get_radian_bins()``) are digitized with a closed-form affine
+            transform; arbitrary edges fall back to a binary search.
+
+        Returns
+        -------
+        np.ndarray
+            Array of per-bin probability masses with the same leading shape
+            as ``arr`` and the final axis running over bins. Each histogram
+            sums to 1 over the -pi to pi range.
+
+        """
+
+        arr = np.asarray(arr, dtype=np.float32)
+
+        nbins = len(bins) - 1
+        n_frames = arr.shape[-1]
+
+        # map every angle onto its bin index in one shot. With uniform bins
+        # (always the case for arange-produced edges) the index is just an
+        # affine transform of the angle, computed in float32 - this avoids
+        # the per-bin search np.histogram performs for general edges. For
+        # genuinely non-uniform edges a vectorized binary search is used
+        # instead. In both cases the clip guards the upper edge (+pi falls
+        # into the final bin).
+        widths = np.diff(bins)
+        if np.allclose(widths, widths[0]):
+            lo = np.float32(bins[0])
+            scale = np.float32(nbins / (bins[-1] - bins[0]))
+            idx = ((arr - lo) * scale).astype(np.intp)
+        else:
+            idx = np.searchsorted(bins, arr, side='right').astype(np.intp) - 1
+        np.clip(idx, 0, nbins - 1, out=idx)
+
+        # flatten all leading axes into rows and offset each row into its own
+        # private index range so one bincount accumulates every histogram
+        n_rows = idx.size // n_frames
+        flat = idx.reshape(n_rows, n_frames) + nbins*np.arange(n_rows, dtype=np.intp)[:, None]
+
+        counts = np.bincount(flat.ravel(), minlength=n_rows*nbins)
+
+        pdf = counts.reshape(arr.shape[:-1] + (nbins,)).astype(np.float32)
+        pdf /= np.float32(n_frames)
+
+        return pdf
+
+    # ........................................................................
+    #
+    #
+    def compute_dihedral_hellingers(self):
+        """
+        Compute the per-residue Hellinger distances between the simulation
+        and polymer-model ensembles for both the phi and psi dihedral
+        distributions.
+
+        Returns
+        -------
+        np.ndarray
+            Array of Hellinger distances with shape
+            (2, n_trajectories, n_residues), where index 0 along the first
+            axis is phi and index 1 is psi.
+
+        """
+
+        if NUMBA_AVAILABLE:
+            # the fused kernel pairs rows from the two ensembles one-to-one,
+            # so both must carry the same number of rows - reshaping the
+            # polymer tensor with a foreign frame count would silently pair
+            # each series against fragments of the wrong polymer series
+            polymer_n_frames = self.polymer_dihedral_angles.shape[-1]
+            if self.dihedral_angles.shape[:-1] != self.polymer_dihedral_angles.shape[:-1]:
+                raise SSException('The simulation and polymer ensembles have different shapes (%s vs %s). Pass truncate=True to window every trajectory to the shortest one.' % (str(self.dihedral_angles.shape), str(self.polymer_dihedral_angles.shape)))
+
+            # the fused kernel histograms and reduces in one parallel pass
+            # over the raw angle arrays
+            nbins = len(self._rad_bins) - 1
+            lo = self._rad_bins[0]
+            bwidth = (self._rad_bins[-1] - lo) / nbins
+
+            numba.set_num_threads(max(1, min(self.n_cpus, numba.config.NUMBA_NUM_THREADS)))
+
+            angles = np.ascontiguousarray(self.dihedral_angles.reshape(-1, self.n_frames))
+            polymer_angles = np.ascontiguousarray(self.polymer_dihedral_angles.reshape(-1, polymer_n_frames))
+
+            hellingers = _hellinger_dihedral_kernel(angles, polymer_angles, lo, bwidth, nbins)
+
+            return hellingers.reshape(self.dihedral_angles.shape[:-1])
+
+        return _hellinger_from_sqrt(self._sqrt_pdf, self._sqrt_polymer_pdf)
+
+    # ........................................................................
+    #
+    #
+    def compute_dihedral_rel_entropy(self):
+        """
+        Compute the per-residue relative entropies between the simulation
+        and polymer-model ensembles for both the phi and psi dihedral
+        distributions.
+
+        Returns
+        -------
+        np.ndarray
+            Array of relative entropies with shape
+            (2, n_trajectories, n_residues), where index 0 along the first
+            axis is phi and index 1 is psi.
+
+        """
+
+        # the cached PDFs already carry phi and psi stacked along the first
+        # axis, so one rel_entropy call reduces the whole tensor in a single
+        # pass through the ufunc loops
+        return rel_entropy(self._pdf, self._polymer_pdf)
+
+    # ........................................................................
+    #
+    #
+    def _get_metric(self, metric):
+        """
+        Internal function that returns the per-residue metric array for a
+        given metric name ('hellinger' or 'rel_entropy'), computing it on
+        first request and caching the result. The inputs are immutable, so
+        repeated plots and property accesses reuse the same arrays.
+
+        """
+
+        ssutils.validate_keyword_option(metric, ['hellinger', 'rel_entropy'], 'metric')
+
+        if metric not in self._metric_cache:
+            if metric == 'hellinger':
+                self._metric_cache[metric] = self.compute_dihedral_hellingers()
+            else:
+                self._metric_cache[metric] = self.compute_dihedral_rel_entropy()
+
+        return self._metric_cache[metric]
+
+    # ........................................................................
+    #
+    #
+    @property
+    def hellingers_distances(self):
+        """
+        Returns the per-residue Hellinger distances between the two
+        ensembles - see ``compute_dihedral_hellingers()``.
+
+        """
+        return self._get_metric('hellinger')
+
+    # ........................................................................
+    #
+    #
+    @property
+    def rel_entropies(self):
+        """
+        Returns the per-residue relative entropies between the two
+        ensembles - see ``compute_dihedral_rel_entropy()``.
+
+        """
+        return self._get_metric('rel_entropy')
+
+    # ........................................................................
+    #
+    #
+    @property
+    def trj_pdfs(self):
+        """
+        Returns the phi and psi probability density functions for the
+        simulation ensemble as an array of shape
+        (2, n_trajectories, n_residues, n_bins), where index 0 along the
+        first axis is phi and index 1 is psi.
+
+        """
+
+        return self._pdf
+
+    # ........................................................................
+    #
+    #
+    @property
+    def polymer_pdfs(self):
+        """
+        Returns the phi and psi probability density functions for the
+        polymer-model ensemble as an array of shape
+        (2, n_trajectories, n_residues, n_bins), where index 0 along the
+        first axis is phi and index 1 is psi.
+
+        """
+
+        return self._polymer_pdf
+
+    # ........................................................................
+    #
+    #
+    @property
+    def phi_angles(self):
+        """
+        Returns the phi angles (radians) for the simulation ensemble with
+        shape (n_trajectories, n_residues, n_frames). This is a view into
+        ``dihedral_angles``.
+
+        """
+        return self.dihedral_angles[0]
+
+    # ........................................................................
+    #
+    #
+    @property
+    def psi_angles(self):
+        """
+        Returns the psi angles (radians) for the simulation ensemble with
+        shape (n_trajectories, n_residues, n_frames). This is a view into
+        ``dihedral_angles``.
+
+        """
+        return self.dihedral_angles[1]
+
+    # ........................................................................
+    #
+    #
+    @property
+    def polymer_phi_angles(self):
+        """
+        Returns the phi angles (radians) for the polymer-model ensemble
+        with shape (n_trajectories, n_residues, n_frames). This is a view
+        into ``polymer_dihedral_angles``.
+
+        """
+        return self.polymer_dihedral_angles[0]
+
+    # ........................................................................
+    #
+    #
+    @property
+    def polymer_psi_angles(self):
+        """
+        Returns the psi angles (radians) for the polymer-model ensemble
+        with shape (n_trajectories, n_residues, n_frames). This is a view
+        into ``polymer_dihedral_angles``.
+
+        """
+        return self.polymer_dihedral_angles[1]
+
+    # ........................................................................
+    #
+    #
+    @property
+    def n_residues(self):
+        """
+        Returns the number of residues for which dihedral angles were
+        computed. Note this is the number of residues with a defined
+        phi/psi angle, which excludes chain termini.
+
+        """
+        return self.dihedral_angles.shape[2]
+
+    # ........................................................................
+    #
+    #
+    @property
+    def n_frames(self):
+        """
+        Returns the number of frames per trajectory.
+
+        """
+        return self.dihedral_angles.shape[-1]
+
+    # ........................................................................
+    #
+    #
+    def quality_plot(self,
+                     dihedral='phi',
+                     metric='hellinger',
+                     annotate=False,
+                     cmap='PuBu',
+                     vmin=0.0,
+                     vmax=1.0,
+                     figsize=(10, 5),
+                     filename=None,
+                     **kwargs):
+        """
+        Render a heatmap of a per-residue metric between the two ensembles,
+        with trajectories on the y-axis and residues on the x-axis. The
+        metric arrays are computed once and cached on the object, so
+        re-plotting with different styling options is free.
+
+        Parameters
+        ----------
+        dihedral : str
+            Which dihedral to plot - must be 'phi' or 'psi'.
+            Default = 'phi'.
+
+        metric : str
+            Which metric to plot - must be 'hellinger' or 'rel_entropy'.
+            Default = 'hellinger'.
+
+        annotate : bool
+            If True, each cell is annotated with its value.
+            Default = False.
+
+        cmap : str
+            A valid matplotlib colormap name. Default = 'PuBu'.
+
+        vmin, vmax : float
+            Bounds for the colormap. Default = 0.0 and 1.0, the bounds of
+            the Hellinger distance (pass vmax=None to autoscale, which is
+            generally what you want for the unbounded relative entropy).
+
+        figsize : tuple
+            Size of the figure in inches. Default = (10, 5).
+
+        filename : str
+            If provided, the figure is also written to this path.
+            Default = None.
+
+        Returns
+        -------
+        tuple
+            Returns the (figure, axis) pair associated with the plot.
+
+        """
+
+        # imported here so the plotting stack is only paid for when a
+        # figure is actually requested - none of the compute paths need it
+        import matplotlib.pyplot as plt
+
+        ssutils.validate_keyword_option(dihedral, ['phi', 'psi'], 'dihedral')
+
+        metric_values = self._get_metric(metric)
+
+        if dihedral == 'phi':
+            data = metric_values[0]
+        else:
+            data = metric_values[1]
+
+        metric_label = {'hellinger': 'Hellinger distance', 'rel_entropy': 'relative entropy'}[metric]
+
+        fig, ax = plt.subplots(figsize=figsize)
+
+        im = ax.imshow(data,
+                       aspect='auto',
+                       interpolation='nearest',
+                       cmap=cmap,
+                       vmin=vmin,
+                       vmax=vmax,
+                       **kwargs)
+
+        cbar = fig.colorbar(im, ax=ax)
+        cbar.set_label(metric_label)
+
+        if annotate:
+            for (row, col), value in np.ndenumerate(np.asarray(data)):
+                ax.text(col, row, '%.2f' % (value), ha='center', va='center', fontsize='x-small')
+
+        ax.set_xlabel('Residue index')
+        ax.set_ylabel('Trajectory')
+        ax.set_title('%s %s' % (dihedral, metric_label))
+
+        if filename is not None:
+            fig.savefig(filename, dpi=300, bbox_inches='tight')
+
+        return (fig, ax)
@@ -0,0 +1,259 @@
+"""
+Unit and regression tests for the sssampling module.
+"""
+# Import package, test suite, and other packages as needed
+import os
+import numpy as np
+import pytest
+import soursop
+from soursop import sstrajectory
+from soursop import sssampling
+from soursop.sssampling import SamplingQuality, hellinger_distance, rel_entropy, glob_traj_paths
+from soursop.ssexceptions import SSException, notYetImplementedException
+
+
+test_data_dir = soursop.get_data('test_data')
+GS6_FILES = ['gs6.pdb', 'gs6.xtc']
+
+
+@pytest.fixture(scope='module')
+def GS6_QUALITY():
+    topology_path = os.path.join(test_data_dir, GS6_FILES[0])
+    trajectory_path = os.path.join(test_data_dir, GS6_FILES[1])
+    return SamplingQuality([trajectory_path], [trajectory_path], topology_path, topology_path, 'dihedral')
+
+
+def test_hellinger_distance_identical():
+    p = np.array([0.1, 0.2, 0.3, 0.4])
+    assert hellinger_distance(p, p) == pytest.approx(0.0)
+
+
+def test_hellinger_distance_disjoint():
+    p = np.array([1.0, 0.0])
+    q = np.array([0.0, 1.0])
+    assert hellinger_distance(p, q) == pytest.approx(1.0)
+
+
+def test_hellinger_distance_symmetric():
+    p = np.array([0.5, 0.3, 0.2])
+    q = np.array([0.2, 0.3, 0.5])
+    assert hellinger_distance(p, q) == pytest.approx(hellinger_distance(q, p))
+
+
+def test_hellinger_distance_batched():
+    # distributions binned along the final axis - leading axes are independent
+    p = np.array([[1.0, 0.0], [0.5, 0.5]])
+    q = np.array([[0.0, 1.0], [0.5, 0.5]])
+    hellingers = hellinger_distance(p, q)
+    assert hellingers.shape == (2,)
+    assert np.allclose(hellingers, [1.0, 0.0])
+
+
+def test_hellinger_distance_shape_mismatch():
+    p = np.array([0.5, 0.5])
+    q = np.array([0.2, 0.3, 0.5])
+    with pytest.raises(SSException):
+        hellinger_distance(p, q)
+
+
+def test_rel_entropy_identical():
+    p = np.array([0.1, 0.2, 0.3, 0.4])
+    assert rel_entropy(p, p) == pytest.approx(0.0)
+
+
+def test_rel_entropy_positive():
+    p = np.array([0.5, 0.3, 0.2])
+    q = np.array([0.2, 0.3, 0.5])
+    assert rel_entropy(p, q) > 0
+
+
+def test_identical_data_short_circuit():
+    # the same array (or an identical view of it) must give exactly zero
+    # for both metrics without relying on floating-point cancellation
+    p = np.array([[0.1, 0.2, 0.7], [0.3, 0.3, 0.4]])
+    view = p[:]
+
+    assert np.all(hellinger_distance(p, p) == 0.0)
+    assert np.all(hellinger_distance(p, view) == 0.0)
+    assert np.all(rel_entropy(p, p) == 0.0)
+    assert np.all(rel_entropy(p, view) == 0.0)
+
+
+def test_rel_entropy_zero_bins():
+    # zero-probability bins in p contribute nothing (the 0*log(0) limit),
+    # while a zero in q where p is non-zero diverges
+    p = np.array([0.0, 0.5, 0.5])
+    q = np.array([0.25, 0.25, 0.5])
+    assert rel_entropy(p, q) == pytest.approx(0.5*np.log(0.5/0.25))
+    assert np.isinf(rel_entropy(q, p))
+
+
+def test_invalid_method():
+    with pytest.raises(SSException):
+        SamplingQuality([], [], None, None, 'invalid_method')
+
+
+def test_unimplemented_method():
+    with pytest.raises(notYetImplementedException):
+        SamplingQuality([], [], None, None, 'rmsd')
+
+
+def test_invalid_bwidth():
+    with pytest.raises(SSException):
+        SamplingQuality([], [], None, None, 'dihedral', bwidth=3*np.pi)
+
+
+def test_bwidth_preserved_in_bins(GS6_QUALITY):
+    # the requested bin width is used as-is - non-integer-degree widths
+    # must not be rounded, and sub-degree widths must not collapse to zero
+    full = GS6_QUALITY.trajs[0]
+
+    for bwidth in [np.deg2rad(15.4), np.deg2rad(0.25)]:
+        SQ = SamplingQuality([full], [full], None, None, 'dihedral', bwidth=bwidth)
+        bins = SQ.get_radian_bins()
+
+        assert bins[1] - bins[0] == pytest.approx(bwidth)
+        assert bins[0] == pytest.approx(-np.pi)
+        assert bins[-1] >= np.pi
+        assert np.allclose(np.sum(SQ.trj_pdfs, axis=-1), 1.0)
+
+
+def test_compute_pdf_normalization(GS6_QUALITY):
+    bins = GS6_QUALITY.get_radian_bins()
+    pdf = GS6_QUALITY.compute_pdf(GS6_QUALITY.phi_angles, bins)
+
+    # each histogram is a probability mass function over [-pi, pi]
+    assert pdf.shape[-1] == len(bins) - 1
+    assert np.allclose(np.sum(pdf, axis=-1), 1.0)
+
+
+def test_compute_pdf_nonuniform_bins(GS6_QUALITY):
+    bins = np.array([-np.pi, -1.0, 0.0, 2.0, np.pi])
+    pdf = GS6_QUALITY.compute_pdf(GS6_QUALITY.phi_angles, bins)
+
+    assert pdf.shape[-1] == len(bins) - 1
+    assert np.allclose(np.sum(pdf, axis=-1), 1.0)
+
+    # the searchsorted fallback must agree with np.histogram
+    angles = np.asarray(GS6_QUALITY.phi_angles, dtype=np.float32)
+    expected = np.histogram(angles[0, 0], bins=bins)[0] / angles.shape[-1]
+    assert np.allclose(pdf[0, 0], expected)
+
+
+def test_self_comparison_is_zero(GS6_QUALITY):
+    # comparing an ensemble against itself - every distance must be zero
+    hellingers = GS6_QUALITY.compute_dihedral_hellingers()
+    entropies = GS6_QUALITY.compute_dihedral_rel_entropy()
+
+    assert hellingers.shape == (2, 1, GS6_QUALITY.n_residues)
+    assert np.allclose(hellingers, 0.0)
+    assert np.allclose(entropies, 0.0)
+
+
+def test_pdf_properties(GS6_QUALITY):
+    trj_pdfs = GS6_QUALITY.trj_pdfs
+    polymer_pdfs = GS6_QUALITY.polymer_pdfs
+
+    nbins = len(GS6_QUALITY.get_degree_bins()) - 1
+    assert trj_pdfs.shape == (2, 1, GS6_QUALITY.n_residues, nbins)
+    assert np.allclose(trj_pdfs, polymer_pdfs)
+
+
+def test_hellinger_paths_agree(GS6_QUALITY):
+    # whichever backend compute_dihedral_hellingers dispatches to (fused
+    # numba kernel or cached-sqrt numpy path), it must agree with the
+    # reference metric applied to the cached PDFs
+    expected = hellinger_distance(np.asarray(GS6_QUALITY.trj_pdfs, dtype=np.float64),
+                                  np.asarray(GS6_QUALITY.polymer_pdfs, dtype=np.float64))
+    assert np.allclose(GS6_QUALITY.compute_dihedral_hellingers(), expected, atol=1e-5)
+
+
+@pytest.mark.skipif(not sssampling.NUMBA_AVAILABLE, reason='numba is not installed')
+def test_hellinger_kernel_matches_histograms():
+    # the fused kernel must reproduce the histogram+metric reference,
+    # including when the two ensembles carry different frame counts
+    rng = np.random.default_rng(42)
+    p = rng.uniform(-np.pi, np.pi, (6, 400))
+    q = rng.uniform(-np.pi, np.pi, (6, 250))
+
+    nbins = 24
+    bins = np.linspace(-np.pi, np.pi, nbins + 1)
+    out = sssampling._hellinger_dihedral_kernel(p, q, -np.pi, 2*np.pi/nbins, nbins)
+
+    for row in range(p.shape[0]):
+        hp = np.histogram(p[row], bins=bins)[0] / p.shape[1]
+        hq = np.histogram(q[row], bins=bins)[0] / q.shape[1]
+        assert out[row] == pytest.approx(hellinger_distance(hp, hq), abs=1e-5)
+
+
+def test_mismatched_ensemble_frame_counts(GS6_QUALITY):
+    # differing (internally uniform) frame counts between the two ensembles
+    # are valid input on every backend
+    full = GS6_QUALITY.trajs[0]
+    short = sstrajectory.SSTrajectory(TRJ=full.traj[0:2])
+
+    SQ = SamplingQuality([full], [short], None, None, 'dihedral')
+    hellingers = SQ.compute_dihedral_hellingers()
+
+    assert hellingers.shape == (2, 1, SQ.n_residues)
+    assert np.all((hellingers >= 0.0) & (hellingers <= 1.0))
+
+
+def test_mismatched_frame_counts(GS6_QUALITY):
+    # ragged trajectory lengths must raise rather than silently degrading
+    # to a dtype=object angle array; truncate=True windows to the shortest
+    full = GS6_QUALITY.trajs[0]
+    short = sstrajectory.SSTrajectory(TRJ=full.traj[0:2])
+
+    with pytest.raises(SSException):
+        SamplingQuality([full, short], [full, short], None, None, 'dihedral')
+
+    SQ = SamplingQuality([full, short], [full, short], None, None, 'dihedral', truncate=True)
+    assert SQ.n_frames == 2
+    assert SQ.dihedral_angles.dtype == np.float32
+
+
+def test_stacked_dihedral_layout(GS6_QUALITY):
+    # phi and psi are stacked along the first axis of dihedral_angles, with
+    # the per-dihedral properties exposing views into the stacked array
+    assert GS6_QUALITY.dihedral_angles.shape[0] == 2
+    assert np.allclose(GS6_QUALITY.dihedral_angles[0], GS6_QUALITY.phi_angles)
+    assert np.allclose(GS6_QUALITY.dihedral_angles[1], GS6_QUALITY.psi_angles)
+
+
+def test_quality_plot_smoke(GS6_QUALITY, tmp_path):
+    # render both metrics headlessly and make sure a figure lands on disk
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    for metric, vmax in [('hellinger', 1.0), ('rel_entropy', None)]:
+        savename = str(tmp_path / ('quality_%s.png' % (metric)))
+        fig, ax = GS6_QUALITY.quality_plot(dihedral='psi', metric=metric, vmax=vmax, annotate=True, filename=savename)
+
+        assert os.path.getsize(savename) > 0
+        plt.close(fig)
+
+
+def test_glob_traj_paths(tmp_path):
+    # build a small replicate-style directory tree, including an excluded
+    # equilibration directory
+    for rep in ['1', '2', '10', 'eq']:
+        rep_dir = tmp_path / 'run' / rep
+        rep_dir.mkdir(parents=True)
+        (rep_dir / '__traj.xtc').touch()
+        (rep_dir / '__START.pdb').touch()
+
+    top_paths, traj_paths = glob_traj_paths(str(tmp_path))
+
+    assert len(top_paths) == 3
+    assert len(traj_paths) == 3
+    assert all('eq' not in os.path.dirname(p).split(os.sep) for p in traj_paths)
+
+    # natural ordering - replicate 10 sorts after 2, not after 1
+    reps = [os.path.basename(os.path.dirname(p)) for p in traj_paths]
+    assert reps == ['1', '2', '10']
+
+    top_paths, traj_paths = glob_traj_paths(str(tmp_path), num_reps=2)
+    assert len(top_paths) == 2
+    assert [os.path.basename(os.path.dirname(p)) for p in traj_paths] == ['1', '2']